@@ -2,6 +2,9 @@ import pandas as pd
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
+import numpy as np
+import io
+import os
 from datetime import datetime, timedelta
 
 # Set page config
@@ -30,6 +33,13 @@ st.markdown("""
         margin-bottom: 1.5rem;
         height: 120px;
     }
+    .metric-row {
+        display: flex;
+        gap: 1rem;
+    }
+    .metric-row > .metric-card {
+        flex: 1;
+    }
     .metric-title {
         color: #5a5c69;
         font-size: 0.85rem;
@@ -78,66 +88,107 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Card markup shared by the pages, formatted with the per-rerun values
+METRIC_CARD = '<div class="metric-card"><div class="metric-title">{title}</div><div class="metric-value">{value}</div></div>'
+INSIGHT_CARD = '<div class="insight-card">{text}</div>'
+
+# CO2 estimate: fixed emission factor for diesel, zero for EV
+DIESEL_EMISSION_FACTOR = 0.3  # kg CO2 per KM (example value, replace with actual data)
+
 # Load sample data (replace with your actual data loading)
 
-@st.cache_data
+# Cached as a resource: every rerun and session shares the one frame instead of
+# unpickling a fresh copy, so nothing below may modify df in place
+@st.cache_resource
 def load_data():
-    chunk_size = 75000
-    all_chunks = []
-    reader = pd.read_csv("data/cleaned_master.csv", chunksize=chunk_size)
-    for i, chunk in enumerate(reader):
-        print(f"Loading chunk {i+1} (up to {chunk_size*(i+1)} records)...")
-        all_chunks.append(chunk)
-        if i == 0: # Load the first chunk and process mappings
-            master = chunk.copy()
-            ticket_types = pd.read_csv("data/ticket_type.csv")
-            service_types = pd.read_csv("data/service_type.csv")
-            form_four = pd.read_csv("data/form_four_trip-6.csv")
-            kms_mapping = form_four.set_index(['schedule_no', 'route_id'])['kms'].to_dict()
-
-            # Map IDs to names
-            master["ticket_type"] = master["ticket_type_short_code"].map(
-                dict(zip(ticket_types["ticket_type_id"], ticket_types["ticket_type_name"])))
-            master["service_type"] = master["bus_service_id"].map(
-                dict(zip(service_types["service_type_id"], service_types["service_type_name"])))
-
-            # Convert dates and calculate derived metrics
-            master["ticket_datetime"] = pd.to_datetime(
-                master["ticket_date"] + " " + master["ticket_time"])
-            master["ticket_date"] = master["ticket_datetime"].dt.date  # Extract date for filtering
-
-            # Calculate initial revenue per km and passengers per km (on the first chunk)
-            master["revenue_per_km"] = master["px_total_amount"] / master["travelled_KM"].replace(0, 1)
-            master["passengers_per_km"] = master["px_count"] / master["travelled_KM"].replace(0, 1)
-
-            def update_travelled_km(row):
-                key = (row['schedule_no'], row['route_id'])
-                return kms_mapping.get(key, row['travelled_KM'])
-
-            master['travelled_KM'] = master.apply(update_travelled_km, axis=1)
-        elif i > 0: # For subsequent chunks, perform the same transformations
-            chunk["ticket_type"] = chunk["ticket_type_short_code"].map(
-                dict(zip(ticket_types["ticket_type_id"], ticket_types["ticket_type_name"])))
-            chunk["service_type"] = chunk["bus_service_id"].map(
-                dict(zip(service_types["service_type_id"], service_types["service_type_name"])))
-            chunk["ticket_datetime"] = pd.to_datetime(
-                chunk["ticket_date"] + " " + chunk["ticket_time"])
-            chunk["ticket_date"] = chunk["ticket_datetime"].dt.date
-            chunk["revenue_per_km"] = chunk["px_total_amount"] / chunk["travelled_KM"].replace(0, 1)
-            chunk["passengers_per_km"] = chunk["px_count"] / chunk["travelled_KM"].replace(0, 1)
-            chunk['travelled_KM'] = chunk.apply(update_travelled_km, axis=1)
-            master = pd.concat([master, chunk]) # Concatenate with the main DataFrame
-            print(f"Processed chunk {i+1} (up to {chunk_size*(i+1)} records).")
-        if i == 0: # Only need to load supporting CSVs once
-            ticket_types = pd.read_csv("data/ticket_type.csv")
-            service_types = pd.read_csv("data/service_type.csv")
-            form_four = pd.read_csv("data/form_four_trip-6.csv")
-            kms_mapping = form_four.set_index(['schedule_no', 'route_id'])['kms'].to_dict()
-
-    print("All data chunks loaded and processed.")
-    return master
+    # Reuse the processed frame from a previous run unless a source CSV (or this
+    # script's processing steps) changed since it was written
+    cache_path = "data/cleaned_master.parquet"
+    sources = ["data/cleaned_master.csv", "data/ticket_type.csv",
+               "data/service_type.csv", "data/form_four_trip-6.csv", __file__]
+    if os.path.exists(cache_path) and all(
+            os.path.getmtime(cache_path) >= os.path.getmtime(src) for src in sources):
+        print(f"Loading processed data from {cache_path}.")
+        return pd.read_parquet(cache_path, engine="pyarrow")
+
+    # Multi-threaded Arrow parser; keep date/time as text so they are combined below
+    master = pd.read_csv(
+        "data/cleaned_master.csv",
+        engine="pyarrow",
+        dtype={"ticket_date": str, "ticket_time": str},
+    )
+    print(f"Loaded {len(master)} records.")
+
+    # Distance overrides per (schedule, route); the last entry wins on duplicate keys
+    form_four = pd.read_csv("data/form_four_trip-6.csv")
+    kms_df = form_four.drop_duplicates(['schedule_no', 'route_id'], keep='last')[['schedule_no', 'route_id', 'kms']]
+    # ID -> name lookups; a fixed dtype keeps the categories independent of the rows present
+    ticket_types = pd.read_csv("data/ticket_type.csv")
+    service_types = pd.read_csv("data/service_type.csv")
+    tt_dtype = pd.CategoricalDtype(ticket_types["ticket_type_name"].dropna().unique())
+    st_dtype = pd.CategoricalDtype(service_types["service_type_name"].dropna().unique())
+
+    def lookup_names(ids, lookup, id_col, name_col, dtype):
+        # Hash join of the IDs against the lookup table, producing category codes directly
+        # (no per-row name strings); the last entry wins on duplicate IDs, unknown IDs become NaN
+        lookup = lookup.drop_duplicates(id_col, keep='last')
+        pos = pd.Index(lookup[id_col]).get_indexer(ids)
+        name_codes = dtype.categories.get_indexer(lookup[name_col])
+        return pd.Categorical.from_codes(np.where(pos >= 0, name_codes[pos], -1), dtype=dtype)
 
-df = load_data()
+    # Map IDs to names
+    master["ticket_type"] = lookup_names(master["ticket_type_short_code"], ticket_types,
+                                         "ticket_type_id", "ticket_type_name", tt_dtype)
+    master["service_type"] = lookup_names(master["bus_service_id"], service_types,
+                                          "service_type_id", "service_type_name", st_dtype)
+
+    # Convert dates and calculate derived metrics
+    # Date and time are parsed separately instead of concatenating a full string column;
+    # times repeat heavily, so each distinct HH:MM:SS is converted once
+    time_codes, times = pd.factorize(master["ticket_time"], use_na_sentinel=False)
+    master["ticket_datetime"] = (pd.to_datetime(master["ticket_date"], format="%Y-%m-%d", cache=True)
+                                 + pd.to_timedelta(times).to_numpy()[time_codes])
+    master["ticket_date"] = master["ticket_datetime"].dt.normalize()  # Midnight of each day, stays datetime64 for filtering
+    master["ticket_month"] = master["ticket_datetime"].to_numpy().astype("datetime64[M]")  # First day of the month
+
+    # Revenue and passengers per km use the recorded distance, before the form_four override;
+    # rows with no recorded distance get 0 instead of a division by zero
+    km = master["travelled_KM"].to_numpy(dtype=np.float32)
+    master["revenue_per_km"] = np.divide(
+        master["px_total_amount"].to_numpy(dtype=np.float32), km,
+        out=np.zeros(len(km), dtype=np.float32), where=km != 0)
+    master["passengers_per_km"] = np.divide(
+        master["px_count"].to_numpy(dtype=np.float32), km,
+        out=np.zeros(len(km), dtype=np.float32), where=km != 0)
+
+    master = master.merge(kms_df, on=['schedule_no', 'route_id'], how='left')
+    master['travelled_KM'] = master['kms'].fillna(master['travelled_KM'])
+    master = master.drop(columns='kms')
+
+    # Narrow numeric columns: float32 halves the bytes scanned by every sum/mean
+    # (pandas still accumulates float32 reductions in float64)
+    for col in ['px_total_amount', 'travelled_KM', 'revenue_per_km', 'passengers_per_km']:
+        master[col] = master[col].astype(np.float32)
+    master['px_count'] = pd.to_numeric(master['px_count'], downcast='unsigned')
+    # Small integer IDs (left as-is if they hold NaNs); sums still accumulate in int64
+    for col in ['trip_no', 'route_id', 'ticket_type_short_code', 'bus_service_id']:
+        master[col] = pd.to_numeric(master[col], downcast='integer')
+
+    # Key columns as categoricals: groupby/isin/unique work on integer codes.
+    # trip_no stays numeric since Fleet Monitoring sums it.
+    for col in ['route_no', 'vehicle_no', 'schedule_no']:
+        master[col] = master[col].astype('category')
+
+    # Chronological order lets the date filters slice with a binary search
+    master = master.sort_values('ticket_datetime', kind='stable').reset_index(drop=True)
+
+    try:
+        master.to_parquet(cache_path, engine="pyarrow", compression="zstd", index=False)
+    except OSError as e:
+        print(f"Could not write {cache_path}: {e}")
+
+    print("All data loaded and processed.")
+    return master
 
 # ====================
 # SIDEBAR NAVIGATION
@@ -150,6 +201,192 @@ page = st.sidebar.radio(
     label_visibility="collapsed"
 )
 
+# Navigation renders first; the first run then shows a spinner while the data is parsed
+with st.spinner("Loading data..."):
+    df = load_data()
+
+@st.cache_data
+def filter_options(_df):
+    # Distinct values for the select widgets, computed once instead of on every rerun
+    return {c: sorted(_df[c].dropna().unique().tolist())
+            for c in ['service_type', 'route_no', 'vehicle_no', 'ticket_type']}
+
+options = filter_options(df)
+
+def present_values(frame, col):
+    # Sorted values of a categorical column that occur in `frame`: one bincount over the
+    # integer codes instead of hashing and sorting the labels of every row
+    codes = frame[col].cat.codes.to_numpy()
+    categories = frame[col].cat.categories
+    return categories[np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(categories)))].tolist()
+
+def slice_by_date(frame, start, end, col='ticket_datetime'):
+    # Rows from the start of `start` to the end of `end`; frame must be sorted by `col`
+    ts = frame[col].to_numpy()
+    i0, i1 = np.searchsorted(ts, [pd.Timestamp(start).to_datetime64(),
+                                  (pd.Timestamp(end) + pd.Timedelta(days=1)).to_datetime64()])
+    return frame.iloc[i0:i1]
+
+@st.cache_data
+def route_daily_agg(_df):
+    # Daily totals per route / service type / ticket type: a few thousand rows that the
+    # Summary page re-filters on every rerun instead of regrouping the full ticket table
+    return _df.groupby(['route_no', 'ticket_date', 'service_type', 'ticket_type'],
+                       observed=True, dropna=False).agg(
+        px_count=('px_count', 'sum'),
+        revenue=('px_total_amount', 'sum'),
+        km=('travelled_KM', 'sum'),
+        epkm_sum=('revenue_per_km', 'sum'),  # Sum and count, so the Summary card can rebuild the row mean
+        epkm_rows=('revenue_per_km', 'count'),
+    ).reset_index().sort_values('ticket_date', kind='stable', ignore_index=True)  # Date order for slice_by_date
+
+@st.cache_resource
+def trips_index(_df):
+    # One row per distinct trip (still in date order), so trip counts hash a small frame
+    # instead of every ticket row
+    return _df[['route_no', 'schedule_no', 'vehicle_no', 'service_type', 'ticket_date', 'trip_no']] \
+        .drop_duplicates().reset_index(drop=True)
+
+# Figures for the Summary and Route Optimization charts are built from small aggregates, so
+# cache them on those inputs and skip rebuilding/serializing the traces when the filters have not changed
+@st.cache_data
+def route_ranking_fig(route_passengers, title, color):
+    fig = px.bar(
+        route_passengers,
+        y=route_passengers.index,
+        x=route_passengers.values,
+        title=title,
+        labels={'x': 'Passengers', 'y': 'Route'},
+        height=400
+    )
+    fig.update_traces(marker_color=color)  # Color all bars the same
+    fig.update_layout(
+        xaxis_title="Passengers",
+        yaxis_title="Route",
+    )
+    return fig
+
+@st.cache_data
+def route_bar_fig(route_table, y, title, y_label, color_scale=None):
+    # Per-route bar for the Route Optimization tabs; with a color_scale the bars are
+    # colored by their own value
+    return px.bar(
+        route_table,
+        x='route_no',
+        y=y,
+        title=title,
+        labels={y: y_label, 'route_no': 'Route'},
+        color=y if color_scale else None,
+        color_continuous_scale=color_scale,
+        height=450
+    )
+
+@st.cache_data
+def daily_revenue_fig(daily_revenue):
+    fig = px.line(
+        daily_revenue,
+        title="<b>Daily Revenue Trend</b>",
+        labels={'value': 'Revenue (₹)', 'date': 'Date'},
+        height=400
+    )
+
+    # Highlight top 3 days
+    top_days = daily_revenue.nlargest(3)
+    for date, value in top_days.items():
+        fig.add_annotation(
+            x=date,
+            y=value,
+            text=f"Peak: ₹{value:,.0f}",
+            showarrow=True,
+            arrowhead=1,
+            ax=0,
+            ay=-40
+        )
+    return fig
+
+@st.cache_data
+def sustain_metrics(_filtered_df, date_range, service_types, bus_type_option):
+    # Sustainability KPIs; keyed on the filter state like export_csv, so reruns that
+    # leave the filters alone skip the pandas work
+
+    # Apply filters: each bus type option is also its service_type label; "All" requires no filtering
+    sustain_df = _filtered_df if bus_type_option == "All" else \
+        _filtered_df[_filtered_df['service_type'] == bus_type_option]
+    
+    # 1.  Calculate total distance for EV and Diesel (masks are built once and reused below)
+    # service_type is categorical, so compare the integer codes rather than the labels;
+    # a label missing from the lookup gets an out-of-range code that matches no row
+    km_arr = np.nan_to_num(sustain_df['travelled_KM'].to_numpy())  # Missing distances count as 0, like Series.sum
+    codes = sustain_df['service_type'].cat.codes.to_numpy()
+    categories = sustain_df['service_type'].cat.categories
+    ev_code = categories.get_loc("EV INTERSTATE") if "EV INTERSTATE" in categories else len(categories)
+    diesel_code = categories.get_loc("MANUAL LOCAL INTERSTATE") if "MANUAL LOCAL INTERSTATE" in categories else len(categories)
+    ev_mask = codes == ev_code
+    # KM per service type in one pass; codes are shifted by one so unmapped rows (-1) land in bucket 0
+    totals = np.bincount(codes + 1, weights=km_arr, minlength=len(categories) + 2)
+    total_distance_ev = totals[ev_code + 1]
+    total_distance_diesel = totals[diesel_code + 1]
+    total_distance_all = totals.sum() # For CO2 savings calculation
+    
+    # 2.  CO2 Emissions (Estimates) - Simplified for demonstration
+    co2_emitted_diesel = total_distance_diesel * DIESEL_EMISSION_FACTOR
+    co2_emitted_ev = 0  # EV emits zero CO2
+    total_co2_emitted = co2_emitted_diesel + co2_emitted_ev
+    
+    # 3. CO2 Saved (Projected) - compared to if *all* were diesel.
+    co2_emitted_all_diesel = total_distance_all * DIESEL_EMISSION_FACTOR
+    co2_saved = co2_emitted_all_diesel - total_co2_emitted
+
+    if total_distance_ev <= 0:
+        # No EV distance in the selection, so there are no routes to rank
+        return total_distance_ev, total_distance_diesel, total_co2_emitted, co2_saved, pd.Series(dtype=np.float64)
+
+    #  Suggest top 3 routes with highest EV KM: EV KM per route code, then a partial
+    #  sort of the routes that ran EV trips instead of sorting every route
+    route_codes = sustain_df['route_no'].cat.codes.to_numpy()
+    route_mask = ev_mask & (route_codes >= 0)  # one gather per array instead of two
+    route_km = km_arr[route_mask]
+    route_codes = route_codes[route_mask]
+    n_routes = len(sustain_df['route_no'].cat.categories)
+    route_totals = np.bincount(route_codes, weights=route_km, minlength=n_routes)
+    ev_routes = np.flatnonzero(np.bincount(route_codes, minlength=n_routes))
+    k = min(3, len(ev_routes))
+    top_idx = ev_routes[np.argpartition(-route_totals[ev_routes], k - 1)[:k]] if k else ev_routes
+    top_idx = top_idx[np.argsort(-route_totals[top_idx], kind='stable')]
+    route_ev_km = pd.Series(route_totals[top_idx], index=sustain_df['route_no'].cat.categories[top_idx])
+
+    return total_distance_ev, total_distance_diesel, total_co2_emitted, co2_saved, route_ev_km
+
+@st.cache_data
+def optimization_stats(_filtered_df, date_range, service_types, route_option, min_distance, max_distance):
+    # Route Optimization aggregates, keyed on the global and page filters like sustain_metrics
+
+    # Apply filters
+    # Route and distance conditions in one mask, so the frame is subset once
+    mask = _filtered_df['travelled_KM'].between(min_distance, max_distance).to_numpy()
+    if route_option != "All":
+        mask &= (_filtered_df['route_no'] == route_option).to_numpy()
+    optimization_df = _filtered_df[mask]
+    
+    avg_passenger_km = optimization_df['passengers_per_km'].mean()
+    avg_revenue_km = optimization_df['revenue_per_km'].mean()
+
+    # One groupby feeds all three route tables
+    route_means = optimization_df.groupby('route_no', observed=True)[['revenue_per_km', 'passengers_per_km']].mean()
+
+    # Passenger Density
+    passenger_density = route_means['passengers_per_km'].sort_values(ascending=False).reset_index()
+
+    # Revenue Efficiency
+    revenue_efficiency = route_means['revenue_per_km'].sort_values(ascending=False).reset_index()
+
+    # Route Efficiency Score
+    route_efficiency = (
+        route_means['revenue_per_km'] / route_means['passengers_per_km'].where(route_means['passengers_per_km'] != 0)
+    ).fillna(0).sort_values(ascending=False).reset_index(name='efficiency_score')
+
+    return avg_passenger_km, avg_revenue_km, passenger_density, revenue_efficiency, route_efficiency
+
 
 # Global filters in sidebar
 st.sidebar.title("Global Filters")
@@ -161,21 +398,22 @@ date_range = st.sidebar.date_input(
 
 service_types = st.sidebar.multiselect(
     "🔧 Service Types",
-    options=df['service_type'].unique(),
+    options=options['service_type'],
     default=[],
     key="global_service_types"
 )
 
-# Apply global filters
-if service_types: # Check if service_types list is not empty
-    filtered_df = df[
-        (df['ticket_datetime'].between(pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1]))) &
-        (df['service_type'].isin(service_types))
-    ]
-else:
-     filtered_df = df[
-        (df['ticket_datetime'].between(pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])))
-    ]
+@st.cache_resource(max_entries=4)
+def global_filter(_df, start, end, service_types):
+    # Apply global filters (whole days, so the daily aggregate matches the row-level data).
+    # Cached as a resource so page switches and other widget changes reuse the same frame
+    # without a pickle round-trip; the pages only read from it.
+    frame = slice_by_date(_df, start, end)
+    if service_types: # Check if service_types list is not empty
+        frame = frame[frame['service_type'].isin(service_types)]
+    return frame
+
+filtered_df = global_filter(df, date_range[0], date_range[1], tuple(service_types))
 
 # ====================
 # PAGE 1: SUMMARY OVERVIEW
@@ -189,23 +427,30 @@ if page == "Summary Overview":
         with cols[0]:
             ticket_types = st.multiselect(
                 "🎟️ Ticket Types",
-                options=df['ticket_type'].unique(),
+                options=options['ticket_type'],
                 default=[],
                 key="summary_ticket_types"
             )
         with cols[1]:
             routes = st.multiselect(
                 "🛣️ Routes (Optional)",
-                options=df['route_no'].unique(),
+                options=options['route_no'],
                 key="summary_routes"
             )
     
     # Apply additional filters
-    summary_df = filtered_df.copy()
+    # Page filters applied to the cached daily aggregate, which feeds the cards and charts
+    summary_agg = route_daily_agg(df)
+    summary_agg = slice_by_date(summary_agg, date_range[0], date_range[1], col='ticket_date')
+    if service_types:
+        summary_agg = summary_agg[summary_agg['service_type'].isin(service_types)]
     if ticket_types:
-        summary_df = summary_df[summary_df['ticket_type'].isin(ticket_types)]
+        summary_agg = summary_agg[summary_agg['ticket_type'].isin(ticket_types)]
     if routes:
-        summary_df = summary_df[summary_df['route_no'].isin(routes)]
+        summary_agg = summary_agg[summary_agg['route_no'].isin(routes)]
+    route_passengers = summary_agg.groupby('route_no', observed=True)['px_count'].sum()
+    totals = summary_agg[['px_count', 'revenue', 'km', 'epkm_sum', 'epkm_rows']].sum()
+    avg_epkm = totals['epkm_sum'] / totals['epkm_rows'] if totals['epkm_rows'] else float('nan')
     
     # Metrics cards
     col1, col2, col3, col4 = st.columns(4)
@@ -213,7 +458,7 @@ if page == "Summary Overview":
         st.markdown(f"""
         <div class="metric-card">
             <div class="metric-title">Total Passengers</div>
-            <div class="metric-value">{summary_df['px_count'].sum():,}</div>
+            <div class="metric-value">{int(totals['px_count']):,}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -221,7 +466,7 @@ if page == "Summary Overview":
         st.markdown(f"""
         <div class="metric-card">
             <div class="metric-title">Total Revenue</div>
-            <div class="metric-value">₹{summary_df['px_total_amount'].sum():,.0f}</div>
+            <div class="metric-value">₹{totals['revenue']:,.0f}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -229,7 +474,7 @@ if page == "Summary Overview":
         st.markdown(f"""
         <div class="metric-card">
             <div class="metric-title">Total Distance</div>
-            <div class="metric-value">{summary_df['travelled_KM'].sum():,.0f} KM</div>
+            <div class="metric-value">{totals['km']:,.0f} KM</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -237,7 +482,7 @@ if page == "Summary Overview":
         st.markdown(f"""
         <div class="metric-card">
             <div class="metric-title">Avg EPKM</div>
-            <div class="metric-value">₹{summary_df['revenue_per_km'].mean():.2f}</div>
+            <div class="metric-value">₹{avg_epkm:.2f}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -248,64 +493,21 @@ if page == "Summary Overview":
         left_column, right_column = st.columns(2)
 
         # Top 5 Routes by Passengers
-        route_passengers_top = summary_df.groupby('route_no')['px_count'].sum().nlargest(5).sort_values(ascending=False)
-        top_colors = ['green'] * len(route_passengers_top)  # Color all bars green
-        fig1_top = px.bar(
-            route_passengers_top,
-            y=route_passengers_top.index,
-            x=route_passengers_top.values,
-            color_discrete_sequence=top_colors,  # Apply the green color list
-            title="<b>Top 5 Routes by Passenger Count</b>",
-            labels={'x': 'Passengers', 'y': 'Route'},
-            height=400
-        )
-        fig1_top.update_layout(
-            xaxis_title="Passengers",
-            yaxis_title="Route",
-        )
-        left_column.plotly_chart(fig1_top, use_container_width=True)
+        route_passengers_top = route_passengers.nlargest(5).sort_values(ascending=False)
+        left_column.plotly_chart(
+            route_ranking_fig(route_passengers_top, "<b>Top 5 Routes by Passenger Count</b>", 'green'),
+            use_container_width=True)
 
         # Bottom 5 Routes by Passengers
-        route_passengers_bottom = summary_df.groupby('route_no')['px_count'].sum().nsmallest(5).sort_values(ascending=False)
-        bottom_colors = ['red'] * len(route_passengers_bottom)  # Color all bars red
-        fig1_bottom = px.bar(
-            route_passengers_bottom,
-            y=route_passengers_bottom.index,
-            x=route_passengers_bottom.values,
-            color_discrete_sequence=bottom_colors,  # Apply the red color list
-            title="<b>Bottom 5 Routes by Passenger Count</b>",
-            labels={'x': 'Passengers', 'y': 'Route'},
-            height=400
-        )
-        fig1_bottom.update_layout(
-            xaxis_title="Passengers",
-            yaxis_title="Route",
-        )
-        right_column.plotly_chart(fig1_bottom, use_container_width=True)
+        route_passengers_bottom = route_passengers.nsmallest(5).sort_values(ascending=False)
+        right_column.plotly_chart(
+            route_ranking_fig(route_passengers_bottom, "<b>Bottom 5 Routes by Passenger Count</b>", 'red'),
+            use_container_width=True)
     
     with tab2:
         # Revenue Trend
-        daily_revenue = summary_df.resample('D', on='ticket_datetime')['px_total_amount'].sum()
-        fig2 = px.line(
-            daily_revenue,
-            title="<b>Daily Revenue Trend</b>",
-            labels={'value': 'Revenue (₹)', 'date': 'Date'},
-            height=400
-        )
-        
-        # Highlight top 3 days
-        top_days = daily_revenue.nlargest(3)
-        for date, value in top_days.items():
-            fig2.add_annotation(
-                x=date,
-                y=value,
-                text=f"Peak: ₹{value:,.0f}",
-                showarrow=True,
-                arrowhead=1,
-                ax=0,
-                ay=-40
-            )
-        
+        daily_revenue = summary_agg.groupby('ticket_date', sort=True)['revenue'].sum().rename('px_total_amount')
+        fig2 = daily_revenue_fig(daily_revenue)
         st.plotly_chart(fig2, use_container_width=True)
 
 # ====================
@@ -320,12 +522,16 @@ elif page == "Route Performance":
         with cols[0]:
             selected_route = st.selectbox(
                 "Select Route",
-                options=sorted(filtered_df['route_no'].unique()),
+                options=present_values(filtered_df, 'route_no'),
                 key="route_selector"
             )
     
     # Filter data for selected route
     route_df = filtered_df[filtered_df['route_no'] == selected_route]
+    route_trips = slice_by_date(trips_index(df), date_range[0], date_range[1], col='ticket_date')
+    if service_types:
+        route_trips = route_trips[route_trips['service_type'].isin(service_types)]
+    route_trips = route_trips[route_trips['route_no'] == selected_route]
     
     # Metrics cards
     col1, col2, col3 = st.columns(3)
@@ -333,7 +539,7 @@ elif page == "Route Performance":
         st.markdown(f"""
         <div class="metric-card">
             <div class="metric-title">Total Trips</div>
-            <div class="metric-value">{route_df['trip_no'].nunique():,}</div>
+            <div class="metric-value">{route_trips['trip_no'].nunique():,}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -358,11 +564,12 @@ elif page == "Route Performance":
     
     with tab1:
         # Schedulewise EPKM
-        schedule_stats = route_df.groupby('schedule_no').agg({
+        schedule_stats = route_df.groupby('schedule_no', observed=True).agg({
             'px_total_amount': 'sum',
-            'travelled_KM': 'mean',
-            'trip_no': 'nunique'
+            'travelled_KM': 'mean'
         }).reset_index()
+        schedule_stats['trip_no'] = schedule_stats['schedule_no'].map(
+            route_trips.groupby('schedule_no', observed=True)['trip_no'].nunique()).astype('int64')
         schedule_stats['epkm'] = schedule_stats['px_total_amount'] / schedule_stats['travelled_KM']
         
         fig1 = px.bar(
@@ -379,7 +586,7 @@ elif page == "Route Performance":
     
     with tab2:
         # Revenue vs Distance
-        trip_stats = route_df.groupby('trip_no').agg({
+        trip_stats = route_df.groupby('trip_no', observed=True).agg({
             'px_total_amount': 'sum',
             'travelled_KM': 'mean',
             'px_count': 'sum'
@@ -399,6 +606,7 @@ elif page == "Route Performance":
                 'px_count': 'Passengers'
             },
             color_continuous_scale='thermal',
+            render_mode='webgl',  # Scattergl: one point per trip can run into the thousands
             height=450
         )
         st.plotly_chart(fig2, use_container_width=True)
@@ -447,7 +655,7 @@ elif page == "Route Optimization":
         with cols[0]:
             route_option = st.selectbox(
                 "Select Route (Optional)",
-                options=["All"] + sorted(filtered_df['route_no'].unique()),
+                options=["All"] + present_values(filtered_df, 'route_no'),
                 key="opt_route_selector"
             )
         with cols[1]:
@@ -467,19 +675,10 @@ elif page == "Route Optimization":
                 key="opt_max_distance"
             )
     
-    # Apply filters
-    optimization_df = filtered_df.copy()
-    if route_option != "All":
-        optimization_df = optimization_df[optimization_df['route_no'] == route_option]
-    
-    optimization_df = optimization_df[
-        (optimization_df['travelled_KM'] >= min_distance) &
-        (optimization_df['travelled_KM'] <= max_distance)
-    ]
+    avg_passenger_km, avg_revenue_km, passenger_density, revenue_efficiency, route_efficiency = optimization_stats(
+        filtered_df, tuple(date_range), tuple(service_types), route_option, min_distance, max_distance)
     
     # Metrics
-    avg_passenger_km = optimization_df['passengers_per_km'].mean()
-    avg_revenue_km = optimization_df['revenue_per_km'].mean()
     efficiency_score = avg_revenue_km / avg_passenger_km if avg_passenger_km else 0
     
     col1, col2, col3 = st.columns(3)
@@ -512,43 +711,20 @@ elif page == "Route Optimization":
     
     with tab1:
         # Passenger Density
-        passenger_density = optimization_df.groupby('route_no')['passengers_per_km'].mean().sort_values(ascending=False).reset_index()
-        fig1 = px.bar(
-            passenger_density,
-            x='route_no',
-            y='passengers_per_km',
-            title="<b>Passenger Density by Route</b>",
-            labels={'passengers_per_km': 'Passengers per KM', 'route_no': 'Route'},
-            height=450
-        )
+        fig1 = route_bar_fig(passenger_density, 'passengers_per_km',
+                             "<b>Passenger Density by Route</b>", 'Passengers per KM')
         st.plotly_chart(fig1, use_container_width=True)
     
     with tab2:
         # Revenue Efficiency
-        revenue_efficiency = optimization_df.groupby('route_no')['revenue_per_km'].mean().sort_values(ascending=False).reset_index()
-        fig2 = px.bar(
-            revenue_efficiency,
-            x='route_no',
-            y='revenue_per_km',
-            title="<b>Revenue per KM by Route</b>",
-            labels={'revenue_per_km': 'Revenue per KM (₹)', 'route_no': 'Route'},
-            height=450
-        )
+        fig2 = route_bar_fig(revenue_efficiency, 'revenue_per_km',
+                             "<b>Revenue per KM by Route</b>", 'Revenue per KM (₹)')
         st.plotly_chart(fig2, use_container_width=True)
     
     with tab3:
         # Route Efficiency Score
-        route_efficiency = optimization_df.groupby('route_no').apply(lambda x: x['revenue_per_km'].mean() / x['passengers_per_km'].mean() if x['passengers_per_km'].mean() else 0).sort_values(ascending=False).reset_index(name='efficiency_score')
-        fig3 = px.bar(
-            route_efficiency,
-            x='route_no',
-            y='efficiency_score',
-            title="<b>Route Efficiency Score</b>",
-            labels={'efficiency_score': 'Efficiency Score', 'route_no': 'Route'},
-            color='efficiency_score',
-            color_continuous_scale='viridis',
-            height=450
-        )
+        fig3 = route_bar_fig(route_efficiency, 'efficiency_score',
+                             "<b>Route Efficiency Score</b>", 'Efficiency Score', color_scale='viridis')
         st.plotly_chart(fig3, use_container_width=True)
     
     # Dynamic Insights
@@ -566,12 +742,11 @@ elif page == "Route Optimization":
             ⚠️ <b>Consider merging/cancelling the following routes:</b>
         </div>
         """, unsafe_allow_html=True)
-        for _, route in low_performing_routes.iterrows():
-            st.markdown(f"""
-            <div class="insight-card">
-                Route {route['route_no']} (Efficiency Score: {route['efficiency_score']:.2f})
-            </div>
-            """, unsafe_allow_html=True)
+        st.markdown("".join(
+            INSIGHT_CARD.format(text=f"Route {route_no} (Efficiency Score: {score:.2f})")
+            for route_no, score in zip(low_performing_routes['route_no'].to_numpy(),
+                                       low_performing_routes['efficiency_score'].to_numpy())),
+            unsafe_allow_html=True)
     else:
         st.markdown(f"""
         <div class="insight-card">
@@ -587,12 +762,11 @@ elif page == "Route Optimization":
             🚌 <b>Consider adding more buses to the following routes during peak hours:</b>
         </div>
         """, unsafe_allow_html=True)
-        for _, route in high_density_routes.iterrows():
-            st.markdown(f"""
-            <div class="insight-card">
-                Route {route['route_no']} (Passenger Density: {route['passengers_per_km']:.2f})
-            </div>
-            """, unsafe_allow_html=True)
+        st.markdown("".join(
+            INSIGHT_CARD.format(text=f"Route {route_no} (Passenger Density: {density:.2f})")
+            for route_no, density in zip(high_density_routes['route_no'].to_numpy(),
+                                         high_density_routes['passengers_per_km'].to_numpy())),
+            unsafe_allow_html=True)
     else:
         st.markdown(f"""
         <div class="insight-card">
@@ -610,7 +784,7 @@ elif page == "Fleet Monitoring":
         with cols[0]:
             selected_vehicle = st.selectbox(
                 "Select Vehicle (Optional)",
-                options=["All"] + sorted(df['vehicle_no'].unique()),
+                options=["All"] + options['vehicle_no'],
                 key="fleet_vehicle_selector"
             )
         with cols[1]:
@@ -621,22 +795,21 @@ elif page == "Fleet Monitoring":
             )
             
     # Filter data (assuming you have vehicle data in your main DataFrame)
-    fleet_df = df.copy() #Using the main dataframe as the user did not provide a new one.
+    fleet_df = slice_by_date(df, date_range_form_four[0], date_range_form_four[1]) #Using the main dataframe as the user did not provide a new one.
     
     if selected_vehicle != "All":
         fleet_df = fleet_df[fleet_df['vehicle_no'] == selected_vehicle]
-    
-    fleet_df = fleet_df[
-        (fleet_df['ticket_datetime'].dt.date >= date_range_form_four[0]) & (fleet_df['ticket_datetime'].dt.date <= date_range_form_four[1])
-    ]
+    fleet_trips = slice_by_date(trips_index(df), date_range_form_four[0], date_range_form_four[1], col='ticket_date')
+    if selected_vehicle != "All":
+        fleet_trips = fleet_trips[fleet_trips['vehicle_no'] == selected_vehicle]
         
     # Metrics (example calculations - adjust based on your actual data structure)
     total_distance = fleet_df['travelled_KM'].sum()
     total_trips = fleet_df['trip_no'].sum()
     
     # Calculate active and idle vehicles.  This assumes that if a vehicle has ANY trips in the filtered data, it is considered active.
-    active_vehicles = fleet_df['vehicle_no'].unique().size
-    total_vehicles = df['vehicle_no'].nunique() # Get the total number of unique vehicles from the entire dataset.
+    active_vehicles = len(present_values(fleet_df, 'vehicle_no'))
+    total_vehicles = len(options['vehicle_no']) # Get the total number of unique vehicles from the entire dataset.
     idle_vehicles = total_vehicles - active_vehicles
     
     col1, col2 = st.columns(2)
@@ -663,7 +836,7 @@ elif page == "Fleet Monitoring":
     
     with tab1:
         # Trips per Vehicle
-        trips_per_vehicle = fleet_df.groupby('vehicle_no')['trip_no'].nunique().sort_values(ascending=False).reset_index(name='trips')
+        trips_per_vehicle = fleet_trips.groupby('vehicle_no', observed=True)['trip_no'].nunique().sort_values(ascending=False).reset_index(name='trips')
         fig1 = px.bar(
             trips_per_vehicle,
             x='vehicle_no',
@@ -676,14 +849,13 @@ elif page == "Fleet Monitoring":
     
     with tab2:
         # Distance Trend (Example: Monthly)
-        distance_trend = fleet_df.groupby(fleet_df['ticket_datetime'].dt.to_period('M'))['travelled_KM'].sum().reset_index()
-        distance_trend['ticket_datetime'] = distance_trend['ticket_datetime'].dt.to_timestamp()
+        distance_trend = fleet_df.groupby('ticket_month', observed=True)['travelled_KM'].sum().reset_index()
         fig2 = px.line(
             distance_trend,
-            x='ticket_datetime',
+            x='ticket_month',
             y='travelled_KM',
             title="<b>Monthly Distance Travelled</b>",
-            labels={'travelled_KM': 'Distance (KM)', 'ticket_datetime': 'Date'},
+            labels={'travelled_KM': 'Distance (KM)', 'ticket_month': 'Date'},
             height=450
         )
         st.plotly_chart(fig2, use_container_width=True)
@@ -696,7 +868,7 @@ elif page == "Fleet Monitoring":
     """, unsafe_allow_html=True)
     
     # Detect underutilized buses
-    avg_trips_per_vehicle = fleet_df.groupby('vehicle_no')['trip_no'].nunique().mean()
+    avg_trips_per_vehicle = trips_per_vehicle['trips'].mean()
     underutilized_vehicles = trips_per_vehicle[trips_per_vehicle['trips'] < avg_trips_per_vehicle * 0.7] # Example threshold
     if not underutilized_vehicles.empty:
         st.markdown("<h4 style='color:red;'>⚠️ Underutilized Buses:</h4>", unsafe_allow_html=True)
@@ -754,67 +926,18 @@ elif page == "Sustainability":
                 key="sustain_bus_type"
             )
     
-    # Apply filters
-    sustain_df = filtered_df.copy()
-    
-    # Filter by bus type.  Correctly apply the filter.
-    if bus_type_option == "EV INTERSTATE":
-        sustain_df = sustain_df[sustain_df['service_type'] == "EV INTERSTATE"]
-    elif bus_type_option == "MANUAL LOCAL INTERSTATE":
-        sustain_df = sustain_df[sustain_df['service_type'] == "MANUAL LOCAL INTERSTATE"]
-    # "All" requires no filtering
+    total_distance_ev, total_distance_diesel, total_co2_emitted, co2_saved, route_ev_km = sustain_metrics(
+        filtered_df, tuple(date_range), tuple(service_types), bus_type_option)
     
-    # 1.  Calculate total distance for EV and Diesel
-    total_distance_ev = sustain_df[sustain_df['service_type'] == "EV INTERSTATE"]['travelled_KM'].sum()
-    total_distance_diesel = sustain_df[sustain_df['service_type'] == "MANUAL LOCAL INTERSTATE"]['travelled_KM'].sum()
-    total_distance_all = sustain_df['travelled_KM'].sum() # For CO2 savings calculation
-    
-    # 2.  CO2 Emissions (Estimates) - Simplified for demonstration
-    # Assume a fixed emission factor for diesel and zero for EV.
-    diesel_emission_factor = 0.3  # kg CO2 per KM (example value, replace with actual data)
-    
-    co2_emitted_diesel = total_distance_diesel * diesel_emission_factor
-    co2_emitted_ev = 0  # EV emits zero CO2
-    total_co2_emitted = co2_emitted_diesel + co2_emitted_ev
-    
-    # 3. CO2 Saved (Projected) - compared to if *all* were diesel.
-    co2_emitted_all_diesel = total_distance_all * diesel_emission_factor
-    co2_saved = co2_emitted_all_diesel - total_co2_emitted
-    
-    # Metrics Cards
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">KM Driven (Diesel)</div>
-            <div class="metric-value">{total_distance_diesel:,.0f} KM</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">KM Driven (EV)</div>
-            <div class="metric-value">{total_distance_ev:,.0f} KM</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">CO2 Emissions (Est.)</div>
-            <div class="metric-value">{total_co2_emitted:,.0f} kg</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    col4 = st.columns(1)
-    with col4[0]:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">CO2 Saved (Projected)</div>
-            <div class="metric-value">{co2_saved:,.0f} kg</div>
-        </div>
-        """, unsafe_allow_html=True)
+    # Metrics Cards: three in a row plus CO2 saved below, sent as one markdown element
+    st.markdown(
+        '<div class="metric-row">'
+        + METRIC_CARD.format(title="KM Driven (Diesel)", value=f"{total_distance_diesel:,.0f} KM")
+        + METRIC_CARD.format(title="KM Driven (EV)", value=f"{total_distance_ev:,.0f} KM")
+        + METRIC_CARD.format(title="CO2 Emissions (Est.)", value=f"{total_co2_emitted:,.0f} kg")
+        + '</div>'
+        + METRIC_CARD.format(title="CO2 Saved (Projected)", value=f"{co2_saved:,.0f} kg"),
+        unsafe_allow_html=True)
     
     # Charts
     
@@ -823,43 +946,47 @@ elif page == "Sustainability":
     st.subheader("Sustainability Insights")
     
     if total_distance_ev > 0:
-        st.markdown(f"""
-        <div class="insight-card">
-            ✅ EV buses have contributed to a reduction of {co2_saved:.0f} kg of CO2 emissions.
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(INSIGHT_CARD.format(
+            text=f"✅ EV buses have contributed to a reduction of {co2_saved:.0f} kg of CO2 emissions."),
+            unsafe_allow_html=True)
     else:
-        st.markdown(f"""
-        <div class="insight-card">
-            ⚠️ No EV buses in operation during the selected period. Consider increasing EV deployment to reduce emissions.
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(INSIGHT_CARD.format(
+            text="⚠️ No EV buses in operation during the selected period. Consider increasing EV deployment to reduce emissions."),
+            unsafe_allow_html=True)
     
     # Suggesting eco-friendly routes (simplified)
     # In a real scenario, you'd have data on route-specific emissions.
     st.markdown("💡 **Potential Eco-Friendly Routes:**", unsafe_allow_html=True)
     
-    #  Suggest top 3 routes with highest EV KM.
-    route_ev_km = sustain_df[sustain_df['service_type'] == 'EV INTERSTATE'].groupby('route_no')['travelled_KM'].sum().sort_values(ascending=False)
     
     if not route_ev_km.empty:
-        for route, distance in route_ev_km.head(3).items(): #show top 3 routes
-            st.markdown(f"""
-            <div class="insight-card">
-                Route {route}: {distance:.0f} KM (EV)
-            </div>
-            """, unsafe_allow_html=True)
+        route_cards = "".join(
+            INSIGHT_CARD.format(text=f"Route {route}: {distance:.0f} KM (EV)")
+            for route, distance in zip(route_ev_km.index.to_numpy()[:3], route_ev_km.to_numpy()[:3])) #show top 3 routes
+        st.markdown(route_cards, unsafe_allow_html=True)
     else:
         st.markdown("No EV bus operation on any route during this period.",unsafe_allow_html=True)
 
 # ====================
 # DATA EXPORT
 # ====================
+@st.cache_data(show_spinner=False)
+def export_csv(_filtered_df, date_range, service_types):
+    # Keyed on the global filters that produced the frame, so reruns with the same filters
+    # reuse the bytes without hashing the frame. Serialize straight into a byte buffer,
+    # 50k rows at a time, rather than building the whole CSV as a str and encoding a copy
+    buf = io.BytesIO()
+    _filtered_df.to_csv(buf, index=False, encoding='utf-8', chunksize=50_000)
+    return buf.getvalue()
+
+if 'export_date_stamp' not in st.session_state:  # Once per session
+    st.session_state['export_date_stamp'] = datetime.now().strftime('%Y%m%d')
+export_stamp = st.session_state['export_date_stamp']
 with st.sidebar:
     st.download_button(
         label="⬇️ Export Data",
-        data=filtered_df.to_csv(index=False).encode('utf-8'),
-        file_name=f"transport_data_{datetime.now().strftime('%Y%m%d')}.csv",
+        data=export_csv(filtered_df, tuple(date_range), tuple(service_types)),
+        file_name=f"transport_data_{export_stamp}.csv",
         mime='text/csv',
         use_container_width=True
     )
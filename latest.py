@@ -1,9 +1,20 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from datetime import datetime
 import plotly.graph_objects as go
 import numpy as np # Import numpy for handling NaN and inf
+import io
+import os
+
+MAX_PREVIEW_ROWS = 1000  # Rows rendered in on-page data tables
+
+# Fixed layouts of the graph_objects charts; only their data changes between reruns
+MONTHLY_LAYOUT = dict(title="Monthly Revenue Trend", xaxis_title="Month", yaxis_title="Revenue (₹)")
+SCHEDULE_EPKM_LAYOUT = dict(title="Average EPKM per Schedule Number", xaxis_title="Schedule Number",
+                            yaxis_title="Average EPKM (₹/km)")
+ROUTE_PASSENGERS_LAYOUT = dict(title="Top Routes by Passenger Count", xaxis_title="Route", yaxis_title="Passengers")
+ROUTE_EPKM_LAYOUT = dict(title="Top Routes by Revenue Efficiency (EPKM)", xaxis_title="Route",
+                         yaxis_title="EPKM (₹/km)")
 
 
 # Configure page settings
@@ -17,24 +28,6 @@ st.set_page_config(
 # Custom CSS styling
 st.markdown("""
 <style>
-    .metric-card {
-        padding: 15px;
-        border-radius: 8px;
-        background-color: white;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        margin-bottom: 15px;
-        border: 1px solid #e0e0e0;
-    }
-    .metric-title {
-        font-size: 14px;
-        color: #555;
-        font-weight: 500;
-    }
-    .metric-value {
-        font-size: 24px;
-        font-weight: 700;
-        color: #222;
-    }
     .plot-container {
         background-color: white;
         padding: 15px;
@@ -47,6 +40,15 @@ st.markdown("""
 
 @st.cache_data
 def load_data():
+    # Reuse the processed frame from a previous run unless the workbook (or this
+    # script's processing steps) changed since it was written; parsing the xlsx
+    # dominates cold start
+    cache_path = "data/latest_processed.parquet"
+    sources = ["data/city_dashboard_datewise_data.xlsx", __file__]
+    if os.path.exists(cache_path) and all(
+            os.path.exists(src) and os.path.getmtime(cache_path) >= os.path.getmtime(src) for src in sources):
+        return pd.read_parquet(cache_path, engine="pyarrow")
+
     # Read Excel file
     # Assuming the Excel file is named 'smart_city_dashboard_datewise_data.xlsx' and is in a 'data' subdirectory
     try:
@@ -60,54 +62,85 @@ def load_data():
     # Drop rows with invalid dates
     df.dropna(subset=['running_date'], inplace=True)
 
-    df['month'] = df['running_date'].dt.month_name()
-    df['day_of_week'] = df['running_date'].dt.day_name()
-    df['service_type'] = df['color_line']
+    # Label columns as categoricals so filters and groupbys work on integer codes;
+    # month and day keep calendar order
+    month_names = pd.date_range("2000-01-01", periods=12, freq="MS").month_name()
+    day_names = pd.date_range("2024-01-01", periods=7, freq="D").day_name()  # Monday first
+    df['month'] = pd.Categorical(df['running_date'].dt.month_name(), categories=month_names, ordered=True)
+    df['day_of_week'] = pd.Categorical(df['running_date'].dt.day_name(), categories=day_names, ordered=True)
+    df['service_type'] = df['color_line'].astype('category')
+    df['route_no'] = df['route_no'].astype('category')
 
     # Ensure numeric types for calculation
     numeric_cols = ['total_amount', 'travel_distance', 'trip_number'] # Include trip_number
     for col in numeric_cols:
         df[col] = pd.to_numeric(df[col], errors='coerce')
 
-    # Calculate Epkm using vectorized operations and handle potential issues
-    # Calculate raw Epkm, will result in inf for division by zero and NaN for NaNs
-    df['Epkm'] = df['total_amount'] / df['travel_distance']
-
-    # Replace infinite values (division by zero) with 0
-    df['Epkm'] = df['Epkm'].replace([np.inf, -np.inf], 0)
-
-    # Replace NaN values (from division with NaN or other issues) with 0
-    df['Epkm'] = df['Epkm'].fillna(0)
-
-    # Round the final Epkm values
-    df['Epkm'] = df['Epkm'].round(2)
-
     # Ensure total_count is numeric and handle NaNs
     df['total_count'] = pd.to_numeric(df['total_count'], errors='coerce')
     df['total_count'] = df['total_count'].fillna(0)
 
 
-    # Drop rows with NaN in critical numeric columns after coercion and Epkm calculation
-    df.dropna(subset=numeric_cols + ['Epkm', 'total_count'], inplace=True)
+    # Drop rows with NaN in critical numeric columns after coercion
+    df.dropna(subset=numeric_cols + ['total_count'], inplace=True)
+
+    # Narrow the numeric columns; every filter, groupby and sum scans them, and the
+    # values fit in 32 bits
+    df = df.astype({'total_count': 'int32', 'trip_number': 'int32',
+                    'travel_distance': 'float32', 'total_amount': 'float32'})
 
 
     if df.empty:
         st.error("Error: No valid data remaining after processing. Please check your data file for correct formats.")
         st.stop()
 
+    try:
+        df.to_parquet(cache_path, engine="pyarrow", compression="zstd")
+    except OSError as e:
+        print(f"Could not write {cache_path}: {e}")
+
     return df
 
+@st.cache_data
+def load_cube(_df):
+    # Sums at the finest grain the page filters and groups on (the loaded frame never
+    # changes within a session, so it is not hashed); filter changes then slice and
+    # re-aggregate this small table instead of scanning every row
+    weeks = _df['running_date'].dt.isocalendar().week.rename('week')
+    return _df.groupby(['month', weeks, 'day_of_week', 'service_type', 'route_no'], observed=True, sort=False).agg(
+        total_amount=('total_amount', 'sum'),
+        total_count=('total_count', 'sum'),
+        travel_distance=('travel_distance', 'sum'),
+        rows=('total_amount', 'size')
+    ).reset_index()
+
+def epkm(sums):
+    # EPKM of grouped sums as total revenue over total distance (not a mean of per-row
+    # ratios); groups that covered no distance get 0
+    return (sums['total_amount'] / sums['travel_distance']).replace([np.inf, -np.inf], 0).fillna(0).rename('Epkm')
+
+def code_mask(col, selected):
+    # Rows of a categorical column whose label is in `selected`: a per-category lookup
+    # table indexed by the row codes (the extra last slot catches missing values, code -1)
+    idx = col.cat.categories.get_indexer(selected)
+    allowed = np.zeros(len(col.cat.categories) + 1, dtype=bool)
+    allowed[idx[idx >= 0]] = True
+    return allowed[col.cat.codes.to_numpy()]
+
+@st.cache_data
+def filter_options(_df):
+    # Option lists for the filter widgets, read off the categoricals in their stored
+    # order (calendar order for month and day); only months present in the data are options
+    def present(col):
+        return _df[col].cat.remove_unused_categories().cat.categories.tolist()
+    return present('month'), _df['day_of_week'].cat.categories.tolist(), present('service_type'), present('route_no')
+
 # Load data
 df = load_data()
+cube = load_cube(df)
 
 # Get filter options
-# Ensure only months present in the data are options
-available_months = sorted(df['month'].unique(),
-                        key=lambda x: datetime.strptime(x, "%B").month)
-day_options = ['Monday', 'Tuesday', 'Wednesday', 'Thursday',
-              'Friday', 'Saturday', 'Sunday']
-color_lines = df['service_type'].unique()
-route_options = df['route_no'].unique()
+available_months, day_options, color_lines, route_options = filter_options(df)
 
 # Dashboard Header
 st.title("🚍 Goa Transport Performance Dashboard")
@@ -133,11 +166,11 @@ with col1:
 
     # Weekly drill-down for selected months - only show if data is not empty
     week_filter = None # Initialize week_filter
-    if len(month_filter) == 1 and not df[df['month'].isin(month_filter)].empty:  # Only show weeks when exactly one month is selected and data exists for that month
-        selected_month_num = datetime.strptime(month_filter[0], "%B").month
-        month_df = df[df['running_date'].dt.month == selected_month_num]
-        if not month_df.empty:
-             week_options = sorted(month_df['running_date'].dt.isocalendar().week.unique())
+    if len(month_filter) == 1:  # Only show weeks when exactly one month is selected
+        # The cube already holds the ISO weeks each month covers
+        month_weeks = cube.loc[code_mask(cube['month'], month_filter), 'week']
+        if not month_weeks.empty:
+             week_options = sorted(month_weeks.unique().tolist())
 
              week_filter = st.multiselect(
                  "Week of Month",
@@ -169,32 +202,90 @@ with col4:
     )
 
 # Apply filters
-# Start with a condition that includes all rows
-filter_condition = pd.Series(True, index=df.index)
-
-# Apply month filter if not empty
-if month_filter:
-    filter_condition = filter_condition & (df['month'].isin(month_filter))
-
-# Apply weekly filter if applicable and not empty
-if week_filter is not None and week_filter:
-     filter_condition = filter_condition & (df['running_date'].dt.isocalendar().week.isin(week_filter))
-
-# Apply day filter if not empty
-if day_filter:
-    filter_condition = filter_condition & (df['day_of_week'].isin(day_filter))
-
-# Apply service filter if not empty
-if service_filter:
-    filter_condition = filter_condition & (df['service_type'].isin(service_filter))
-
-# Apply route filter if not empty
-if route_filter:
-    filter_condition = filter_condition & (df['route_no'].isin(route_filter))
+def narrows(selected, options):
+    # An empty selection means "all", and so does selecting every option
+    return 0 < len(selected) < len(options)
+
+def filter_mask(frame, weeks, months, week_numbers, days, services, routes):
+    # Each selection is a tuple, empty when that filter does not narrow the data.
+    # `weeks` is called only when the week filter applies, since deriving ISO weeks
+    # from the row-level dates is not free
+    # Start with a condition that includes all rows
+    mask = np.ones(len(frame), dtype=bool)
+
+    # Apply month filter if not empty
+    if months:
+        mask &= code_mask(frame['month'], months)
+
+    # Apply weekly filter if applicable and not empty
+    if week_numbers:
+        mask &= weeks().isin(week_numbers).to_numpy()
+
+    # Apply day filter if not empty
+    if days:
+        mask &= code_mask(frame['day_of_week'], days)
+
+    # Apply service filter if not empty
+    if services:
+        mask &= code_mask(frame['service_type'], services)
+
+    # Apply route filter if not empty
+    if routes:
+        mask &= code_mask(frame['route_no'], routes)
+
+    return mask
+
+@st.cache_data(max_entries=64)
+def compute_views(_cube, months, week_numbers, days, services, routes):
+    # Filtered cube plus the KPI, monthly, day-of-week and top-route aggregates for one
+    # filter state, so revisiting a combination is a cache lookup
+    filtered_cube = _cube[filter_mask(_cube, lambda: _cube['week'], months, week_numbers, days, services, routes)]
+
+    # One reduction over the cube's column blocks; the result is float64, so the
+    # passenger count is cast back to int for display. Distance keeps any fractional
+    # km (rounded past the float32 noise) and only shows as an int when it is whole
+    totals = filtered_cube[['total_count', 'total_amount', 'travel_distance']].sum()
+    total_distance = round(float(totals['travel_distance']), 1)
+    kpis = {
+        'total_passengers': int(totals['total_count']),
+        'total_revenue': totals['total_amount'],
+        'total_distance': int(total_distance) if total_distance.is_integer() else total_distance,
+        'avg_epkm': totals['total_amount'] / totals['travel_distance'] if totals['travel_distance'] else 0
+    }
 
+    # One month x day walk feeds both views: the monthly totals roll it up further.
+    # month is an ordered categorical, so the groups already come out in calendar order
+    daily_sums = filtered_cube.groupby(['month', 'day_of_week'], observed=True)[['total_amount', 'total_count', 'rows']].sum()
+    monthly_revenue = daily_sums.groupby(level='month', observed=True)[['total_amount', 'total_count']].sum().reset_index()
+
+    # Mean per row, rebuilt from the cube's sums and row counts
+    daily_revenue = (daily_sums['total_amount'] / daily_sums['rows']).rename('total_amount').reset_index()
+
+    # nlargest picks the top routes itself, so skip groupby's sort of the route keys
+    route_sums = filtered_cube.groupby('route_no', observed=True, sort=False)[['total_count', 'total_amount', 'travel_distance']].sum()
+    route_passengers = route_sums['total_count'].nlargest(10)
+    route_epkm = epkm(route_sums).nlargest(10)
+
+    return filtered_cube, kpis, monthly_revenue, daily_revenue, route_passengers, route_epkm
+
+# Selections that do not narrow the data collapse to (), so "none" and "all" share
+# one cache entry
+filter_keys = (
+    tuple(sorted(month_filter)) if narrows(month_filter, available_months) else (),
+    tuple(sorted(week_filter)) if week_filter is not None and narrows(week_filter, week_options) else (),
+    tuple(sorted(day_filter)) if narrows(day_filter, day_options) else (),
+    tuple(sorted(service_filter)) if narrows(service_filter, color_lines) else (),
+    tuple(sorted(route_filter)) if narrows(route_filter, route_options) else ()
+)
+filter_condition = filter_mask(df, lambda: df['running_date'].dt.isocalendar().week, *filter_keys)
 
-# Apply the combined filter condition
-filtered_df = df[filter_condition].copy()
+# Apply the combined filter condition; nothing below modifies filtered_df, so when no
+# filter narrows the data it is simply df. Sums and means come from the cached cube
+# views, the row-level frame only feeds the schedule and per-date views, so a narrowed
+# frame carries just the columns those read
+ROW_COLUMNS = ['running_date', 'month', 'route_no', 'schedule_number', 'total_amount', 'travel_distance', 'trip_number']
+filtered_df = df if filter_condition.all() else df.loc[filter_condition, ROW_COLUMNS]
+filtered_cube, kpis, monthly_revenue, daily_revenue, route_passengers, route_epkm = compute_views(cube, *filter_keys)
 
 # Check if filtered_df is empty after applying filters
 if filtered_df.empty:
@@ -208,10 +299,10 @@ col1, col2, col3, col4 = st.columns(4)
 
 # Calculate metrics only if filtered_df is not empty
 if not filtered_df.empty:
-    total_passengers = filtered_df['total_count'].sum()
-    total_revenue = filtered_df['total_amount'].sum()
-    total_distance = filtered_df['travel_distance'].sum()
-    avg_epkm = filtered_df['Epkm'].mean() if not filtered_df['Epkm'].isnull().all() else 0 # Handle case where Epkm might be empty after filtering
+    total_passengers = kpis['total_passengers']
+    total_revenue = kpis['total_revenue']
+    total_distance = kpis['total_distance']
+    avg_epkm = kpis['avg_epkm']
 else:
     total_passengers = 0
     total_revenue = 0
@@ -219,37 +310,11 @@ else:
     avg_epkm = 0
 
 
-with col1:
-    st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">Total Passengers</div>
-            <div class="metric-value">{total_passengers:,}</div>
-        </div>
-    """, unsafe_allow_html=True)
-
-with col2:
-    st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">Total Revenue</div>
-            <div class="metric-value">₹{total_revenue:,.0f}</div>
-        </div>
-    """, unsafe_allow_html=True)
-
-with col3:
-    st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">Total Distance</div>
-            <div class="metric-value">{total_distance:,} km</div>
-        </div>
-    """, unsafe_allow_html=True)
-
-with col4:
-    st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">Avg EPKM</div>
-            <div class="metric-value">₹{avg_epkm:.2f}</div>
-        </div>
-    """, unsafe_allow_html=True)
+# Native metric components; no HTML to sanitize on each rerun
+col1.metric("Total Passengers", f"{total_passengers:,}")
+col2.metric("Total Revenue", f"₹{total_revenue:,.0f}")
+col3.metric("Total Distance", f"{total_distance:,} km")
+col4.metric("Avg EPKM", f"₹{avg_epkm:.2f}")
 
 # Visualization Section
 # Visualization Section
@@ -270,19 +335,15 @@ with st.container():
         st.markdown("#### Monthly Revenue Trend")
         # Ensure data exists before plotting
         if not filtered_df.empty:
-            monthly_revenue = filtered_df.groupby('month').agg({
-                'total_amount': 'sum',
-                'total_count': 'sum'
-            }).reindex(available_months).reset_index()
-
-            fig = px.line(
-                monthly_revenue,
-                x='month',
-                y='total_amount',
-                markers=True,
-                title="Monthly Revenue Trend",
-                labels={'total_amount': 'Revenue (₹)', 'month': 'Month'}
-            )
+            # Plain float32/int32 NumPy arrays are shipped to the browser as typed arrays;
+            # single-trace charts are built with graph_objects, skipping Plotly Express's
+            # frame reshaping
+            fig = go.Figure(go.Scatter(
+                x=monthly_revenue['month'].to_numpy(),
+                y=monthly_revenue['total_amount'].to_numpy(dtype='float32'),
+                mode='lines+markers'
+            ))
+            fig.update_layout(**MONTHLY_LAYOUT)
             st.plotly_chart(fig, use_container_width=True)
 
             st.markdown("""
@@ -328,10 +389,6 @@ with st.container():
         st.markdown("#### Average Daily Revenue by Month")
         # Ensure data exists before plotting
         if not filtered_df.empty:
-            daily_revenue = filtered_df.groupby(['month', 'day_of_week']).agg({
-                'total_amount': 'mean'
-            }).reset_index()
-
             fig = px.bar(
                 daily_revenue,
                 x='day_of_week',
@@ -389,18 +446,16 @@ with st.container():
         # Ensure data exists before plotting
         if not filtered_df.empty:
             # Calculate average EPKM per schedule number
-            schedule_epkm = filtered_df.groupby('schedule_number')['Epkm'].mean().reset_index()
+            schedule_epkm = epkm(filtered_df.groupby('schedule_number')[['total_amount', 'travel_distance']].sum()).reset_index()
 
             # Sort by average EPKM for better visualization (optional)
             schedule_epkm = schedule_epkm.sort_values('Epkm', ascending=False)
 
-            fig = px.bar(
-                schedule_epkm,
-                x='schedule_number',
-                y='Epkm',
-                title="Average EPKM per Schedule Number",
-                labels={'Epkm': 'Average EPKM (₹/km)', 'schedule_number': 'Schedule Number'}
-            )
+            fig = go.Figure(go.Bar(
+                x=schedule_epkm['schedule_number'].to_numpy(),
+                y=schedule_epkm['Epkm'].to_numpy(dtype='float32')
+            ))
+            fig.update_layout(**SCHEDULE_EPKM_LAYOUT)
             st.plotly_chart(fig, use_container_width=True)
 
             st.markdown("""
@@ -426,7 +481,9 @@ with st.container():
 
                 if not schedule_data_filtered.empty:
                     # Calculate average EPKM for the selected schedules
-                    schedule_epkm_filtered = schedule_data_filtered.groupby('schedule_number')['Epkm'].mean().reset_index()
+                    schedule_epkm_filtered = epkm(
+                        schedule_data_filtered.groupby('schedule_number')[['total_amount', 'travel_distance']].sum()
+                    ).reset_index()
 
                     fig_schedule_drilldown = px.bar(
                         schedule_epkm_filtered,
@@ -494,7 +551,16 @@ with st.container():
 
             # Add table below the chart
             st.markdown("##### Data Table for Trips per Schedule")
-            st.dataframe(trips_per_schedule_day_bar)
+            # Preview at most MAX_PREVIEW_ROWS rows; the full table is offered as a download
+            st.dataframe(trips_per_schedule_day_bar.head(MAX_PREVIEW_ROWS))
+            if len(trips_per_schedule_day_bar) > MAX_PREVIEW_ROWS:
+                st.caption(f"Showing the first {MAX_PREVIEW_ROWS:,} of {len(trips_per_schedule_day_bar):,} rows.")
+                st.download_button(
+                    label="⬇️ Download full table",
+                    data=trips_per_schedule_day_bar.to_csv(index=False).encode('utf-8'),
+                    file_name="trips_per_schedule.csv",
+                    mime='text/csv'
+                )
 
             st.markdown("""
             **Analysis:** This bar chart visualizes the total number of trips completed by each schedule on a daily basis.
@@ -520,15 +586,18 @@ with st.container():
         if selected_route_drilldown != 'Select a Route':
             st.markdown(f"##### Performance by Day of Week for Route {selected_route_drilldown}")
             # Filter data for the selected route
-            route_data_drilldown = filtered_df[filtered_df['route_no'] == selected_route_drilldown]
+            route_data_drilldown = filtered_cube[filtered_cube['route_no'] == selected_route_drilldown]
 
             if not route_data_drilldown.empty:
                 # Group by day of week and calculate metrics
-                route_grouped_df = route_data_drilldown.groupby('day_of_week', observed=True).agg(
-                    Total_Revenue=('total_amount', 'sum'),
-                    Total_Passengers=('total_count', 'sum'),
-                    Average_EPKM=('Epkm', 'mean')
-                ).reindex(day_options).fillna(0).reset_index() # Reindex to ensure all days are present and ordered
+                route_sums = route_data_drilldown.groupby('day_of_week', observed=True, sort=False)[
+                    ['total_amount', 'total_count', 'travel_distance']
+                ].sum()
+                route_grouped_df = pd.DataFrame({
+                    'Total_Revenue': route_sums['total_amount'],
+                    'Total_Passengers': route_sums['total_count'],
+                    'Average_EPKM': epkm(route_sums)
+                }).reindex(day_options).fillna(0).reset_index() # Reindex to ensure all days are present and ordered
 
 
                 # Display trend charts for the selected route
@@ -574,12 +643,11 @@ with st.container():
         with col1:
             # Ensure data exists before plotting
             if not filtered_df.empty:
-                route_passengers = filtered_df.groupby('route_no')['total_count'].sum().nlargest(10)
-                fig = px.bar(
-                    route_passengers,
-                    title="Top Routes by Passenger Count",
-                    labels={'value': 'Passengers', 'index': 'Route'}
-                )
+                fig = go.Figure(go.Bar(
+                    x=route_passengers.index.to_numpy(),
+                    y=route_passengers.to_numpy(dtype='int32')
+                ))
+                fig.update_layout(**ROUTE_PASSENGERS_LAYOUT)
                 st.plotly_chart(fig, use_container_width=True)
 
                 st.markdown("""
@@ -593,12 +661,11 @@ with st.container():
         with col2:
             # Ensure data exists before plotting
             if not filtered_df.empty:
-                route_epkm = filtered_df.groupby('route_no')['Epkm'].mean().nlargest(10)
-                fig = px.bar(
-                    route_epkm,
-                    title="Top Routes by Revenue Efficiency (EPKM)",
-                    labels={'value': 'EPKM (₹/km)', 'index': 'Route'}
-                )
+                fig = go.Figure(go.Bar(
+                    x=route_epkm.index.to_numpy(),
+                    y=route_epkm.to_numpy(dtype='float32')
+                ))
+                fig.update_layout(**ROUTE_EPKM_LAYOUT)
                 st.plotly_chart(fig, use_container_width=True)
 
                 st.markdown("""
@@ -613,16 +680,28 @@ with st.container():
 
 
 # Export Option
+@st.cache_data(max_entries=4, show_spinner=False)
+def export_csv(_df, _filter_condition, filter_keys):
+    # Keyed on the filter state that produced the mask, so neither the frame nor the mask
+    # is hashed. The export has every column, so the rows are selected from df here
+    # rather than taken from the column-trimmed filtered_df; written straight into a byte
+    # buffer rather than a str that is then encoded
+    buf = io.BytesIO()
+    _df[_filter_condition].to_csv(buf, index=False, encoding='utf-8', chunksize=50_000)
+    return buf.getvalue()
+
 st.markdown("---")
 with st.expander("Export Data"):
     # Only show download button if data exists
     if not filtered_df.empty:
         st.write(f"Filtered dataset contains {len(filtered_df)} records")
-        st.download_button(
-            "Download Filtered Data",
-            filtered_df.to_csv(index=False).encode('utf-8'),
-            "filtered_transport_data.csv",
-            "text/csv"
-        )
+        # The CSV is only built once asked for, not on every rerun
+        if st.checkbox("Prepare CSV download", key='export_prepare'):
+            st.download_button(
+                "Download Filtered Data",
+                export_csv(df, filter_condition, filter_keys),
+                "filtered_transport_data.csv",
+                "text/csv"
+            )
     else:
         st.info("No data available to export.")
@@ -1,10 +1,12 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from datetime import datetime
 import plotly.graph_objects as go
 import numpy as np # Import numpy for handling NaN and inf
 import base64 # For embedding images/icons if needed (though SVGs/Emojis preferred)
+import os
+
+MAX_PREVIEW_ROWS = 1000  # Rows rendered in on-page data tables
 
 # Configure page settings
 st.set_page_config(
@@ -135,6 +137,15 @@ def load_data():
     Loads data from an Excel file, performs data cleaning and preparation.
     Caches the data to improve performance.
     """
+    # Reuse the processed frame from a previous run unless the workbook (or this
+    # script's processing steps) changed since it was written; parsing the xlsx
+    # dominates cold start
+    cache_path = "data/latest_drilled_down_processed.parquet"
+    sources = ["data/city_dashboard_datewise_data.xlsx", __file__]
+    if os.path.exists(cache_path) and all(
+            os.path.exists(src) and os.path.getmtime(cache_path) >= os.path.getmtime(src) for src in sources):
+        return pd.read_parquet(cache_path, engine="pyarrow")
+
     # Read Excel file
     # Assuming the Excel file is named 'city_dashboard_datewise_data.xlsx' and is in a 'data' subdirectory
     try:
@@ -155,9 +166,18 @@ def load_data():
     df.dropna(subset=['running_date'], inplace=True)
 
     # Create date-related columns
-    df['month'] = df['running_date'].dt.month_name()
-    df['day_of_week'] = df['running_date'].dt.day_name()
-    df['service_type'] = df['color_line'] # Rename for clarity if needed later
+    # ISO week and month number are derived once here rather than from the dates on every rerun
+    df['iso_week'] = df['running_date'].dt.isocalendar().week.astype('uint8')
+    df['month_num'] = df['running_date'].dt.month.astype('uint8')
+    # Label columns as categoricals so filters and groupbys work on integer codes;
+    # month and day keep calendar order
+    month_names = pd.date_range("2000-01-01", periods=12, freq="MS").month_name()
+    day_names = pd.date_range("2024-01-01", periods=7, freq="D").day_name()  # Monday first
+    df['month'] = pd.Categorical(df['running_date'].dt.month_name(), categories=month_names, ordered=True)
+    df['day_of_week'] = pd.Categorical(df['running_date'].dt.day_name(), categories=day_names, ordered=True)
+    df['service_type'] = df['color_line'].astype('category') # Rename for clarity if needed later
+    df['route_no'] = df['route_no'].astype('category')
+    df['schedule_number'] = df['schedule_number'].astype('category')
 
     # Ensure critical numeric columns are numeric, coercing errors to NaN
     numeric_cols = ['total_amount', 'travel_distance', 'trip_number', 'total_count', 'running_time']
@@ -173,22 +193,17 @@ def load_data():
 
     # Calculate Epkm (Earnings per Kilometer)
     # Handle potential division by zero and NaN values
-    # Use .copy() to avoid SettingWithCopyWarning
-    df_cleaned = df.copy()
-
-    # Calculate raw Epkm, will result in inf for division by zero and NaN for NaNs
-    # Add a small epsilon to travel_distance to avoid exact division by zero
-    epsilon = 1e-9
-    df_cleaned['Epkm'] = df_cleaned['total_amount'] / (df_cleaned['travel_distance'] + epsilon)
-
-    # Replace infinite values (division by zero) with 0
-    df_cleaned['Epkm'] = df_cleaned['Epkm'].replace([np.inf, -np.inf], 0)
-
-    # Replace NaN values (from division with NaN or other issues) with 0
-    df_cleaned['Epkm'] = df_cleaned['Epkm'].fillna(0)
-
-    # Round the final Epkm values for display
-    df_cleaned['Epkm'] = df_cleaned['Epkm'].round(2)
+    # df is this function's own frame, so it is cleaned in place rather than copied
+    df_cleaned = df
+
+    # One masked float32 divide: rows with no positive (or a missing) distance keep the
+    # 0 they start with instead of producing inf/NaN, then round in place for display
+    amount = df_cleaned['total_amount'].to_numpy(dtype=np.float32)
+    distance = df_cleaned['travel_distance'].to_numpy(dtype=np.float32)
+    epkm = np.zeros(len(distance), dtype=np.float32)
+    np.divide(amount, distance, out=epkm, where=distance > 0)
+    np.round(epkm, 2, out=epkm)
+    df_cleaned['Epkm'] = epkm
 
     # Ensure total_count and trip_number are treated as integers where appropriate
     for col in ['total_count', 'trip_number']:
@@ -207,19 +222,29 @@ def load_data():
         st.error("Error: No valid data remaining after processing. Please check your data file for correct formats and missing values in critical columns.")
         st.stop()
 
+    try:
+        df_cleaned.to_parquet(cache_path, engine="pyarrow", compression="zstd")
+    except OSError as e:
+        print(f"Could not write {cache_path}: {e}")
+
     return df_cleaned
 
+@st.cache_data
+def filter_options(_df):
+    """
+    Option lists for the filter widgets, read off the categoricals in their stored order
+    (calendar order for month and day, sorted for routes). Only months present in the
+    data are options.
+    """
+    def present(col):
+        return _df[col].cat.remove_unused_categories().cat.categories.tolist()
+    return present('month'), _df['day_of_week'].cat.categories.tolist(), present('service_type'), present('route_no')
+
 # Load data
 df = load_data()
 
 # Get filter options from the loaded data
-# Ensure only months present in the data are options
-available_months = sorted(df['month'].unique(),
-                        key=lambda x: datetime.strptime(x, "%B").month)
-day_options = ['Monday', 'Tuesday', 'Wednesday', 'Thursday',
-              'Friday', 'Saturday', 'Sunday']
-color_lines = df['service_type'].unique()
-route_options = sorted(df['route_no'].unique().tolist()) # Sort route options
+available_months, day_options, color_lines, route_options = filter_options(df)
 
 # Dashboard Header
 st.title("🚍 KTCL Performance Dashboard")
@@ -247,13 +272,14 @@ with filter_col1:
 
     # Weekly drill-down for selected months - only show if data is not empty and exactly one month is selected
     week_filter = None # Initialize week_filter
-    # Check if exactly one month is selected and if there's data for that month
-    if len(month_filter) == 1 and not df[df['month'].isin(month_filter)].empty:
-        selected_month_num = datetime.strptime(month_filter[0], "%B").month
-        month_df = df[df['running_date'].dt.month == selected_month_num].copy() # Use .copy()
+    # Check if exactly one month is selected; month_df.empty below covers a month with no data
+    if len(month_filter) == 1:
+        # Month categories are in calendar order, so the month number is the category position + 1
+        selected_month_num = df['month'].cat.categories.get_loc(month_filter[0]) + 1
+        month_df = df[df['month_num'] == selected_month_num]
         if not month_df.empty:
              # Calculate week numbers relative to the start of the year (ISO week)
-             week_options = sorted(month_df['running_date'].dt.isocalendar().week.unique())
+             week_options = sorted(month_df['iso_week'].unique())
 
              week_filter = st.multiselect(
                  "Select Week(s) (within selected month)",
@@ -290,19 +316,28 @@ with filter_col4:
     )
 
 # Apply filters
-# Start with a condition that includes all rows
-filter_condition = pd.Series(True, index=df.index)
+def code_mask(col, selected):
+    # Rows of a categorical column whose label is in `selected`: a per-category lookup
+    # table indexed by the row codes (the extra last slot catches missing values, code -1)
+    idx = col.cat.categories.get_indexer(selected)
+    allowed = np.zeros(len(col.cat.categories) + 1, dtype=bool)
+    allowed[idx[idx >= 0]] = True
+    return allowed[col.cat.codes.to_numpy()]
+
+# Start with a condition that includes all rows; each active filter ANDs its
+# membership test into this plain boolean array in place
+filter_condition = np.ones(len(df), dtype=bool)
 
 # Apply month filter if not empty
 if month_filter:
-    filter_condition = filter_condition & (df['month'].isin(month_filter))
+    filter_condition &= code_mask(df['month'], month_filter)
 
 # Apply weekly filter if applicable and not empty
 # Check if week_filter is not None (meaning a single month was selected) and if it's not empty
 if week_filter is not None and week_filter:
      # Ensure the weekly filter is applied only to the data already filtered by month
      # This prevents applying week numbers from other months if the user clears the month filter after selecting weeks
-     filter_condition = filter_condition & (df['running_date'].dt.isocalendar().week.isin(week_filter))
+     filter_condition &= df['iso_week'].isin(week_filter).to_numpy()
 elif week_filter is not None and not week_filter:
      # If weekly filter is shown but empty, it means the user explicitly deselected all weeks
      # In this case, the filter condition should exclude all rows for weekly data within the selected month
@@ -314,26 +349,81 @@ elif week_filter is not None and not week_filter:
 
 # Apply day filter if not empty
 if day_filter:
-    filter_condition = filter_condition & (df['day_of_week'].isin(day_filter))
+    filter_condition &= code_mask(df['day_of_week'], day_filter)
 
 # Apply service filter if not empty
 if service_filter:
-    filter_condition = filter_condition & (df['service_type'].isin(service_filter))
+    filter_condition &= code_mask(df['service_type'], service_filter)
 
 # Apply route filter if not empty
 if route_filter:
-    filter_condition = filter_condition & (df['route_no'].isin(route_filter))
+    filter_condition &= code_mask(df['route_no'], route_filter)
 
 
-# Apply the combined filter condition to get the final filtered DataFrame
-# Use .copy() to avoid SettingWithCopyWarning in subsequent operations
-filtered_df = df[filter_condition].copy()
+# Apply the combined filter condition to get the final filtered DataFrame. No copy:
+# nothing below writes to filtered_df (views that add columns take their own .copy())
+filtered_df = df[filter_condition]
 
 # Check if filtered_df is empty after applying filters
 if filtered_df.empty:
     st.warning("⚠️ No data available for the selected filters. Please adjust your filter criteria.")
     st.stop() # Stop execution if no data matches filters
 
+@st.cache_data(max_entries=64)
+def tab_aggregates(_filtered_df, filter_key):
+    """
+    Builds the fixed aggregates behind the monthly, daily, schedule and route tabs.
+    Keyed on the filter selections that produced the frame, so reruns triggered by the
+    tabs' own widgets reuse them without hashing the frame.
+    """
+    # One month x day walk; the monthly totals and both day-of-week views roll it up,
+    # with means rebuilt as sum / row count
+    month_day = _filtered_df.groupby(['month', 'day_of_week'], observed=True, sort=False).agg(
+        total_amount=('total_amount', 'sum'),
+        total_count=('total_count', 'sum'),
+        rows=('total_amount', 'count')
+    )
+
+    monthly_agg = month_day.groupby(level='month', observed=True, sort=False)[
+        ['total_amount', 'total_count']
+    ].sum().reindex(available_months).reset_index()
+
+    day_totals = month_day.groupby(level='day_of_week', observed=True, sort=False).sum()
+    daily_pattern_agg = pd.DataFrame({
+        'avg_revenue': day_totals['total_amount'] / day_totals['rows'],
+        'avg_passengers': day_totals['total_count'] / day_totals['rows']
+    }).reindex(day_options).fillna(0).reset_index() # Reindex to ensure all days are present and ordered
+
+    daily_revenue_by_month = (month_day['total_amount'] / month_day['rows']).rename('total_amount').reset_index()
+
+    schedule_stats = _filtered_df.groupby('schedule_number', observed=True, sort=False).agg(
+        avg_epkm=('Epkm', 'mean'),
+        total_trips=('trip_number', 'count'), # Count of records for the schedule
+        total_revenue=('total_amount', 'sum'),
+        total_distance=('travel_distance', 'sum')
+    ).reset_index()
+
+    # One route groupby feeds the tab 5 top-10 lists and the route statistics of the
+    # passenger and EPKM tabs
+    route_stats = _filtered_df.groupby('route_no', observed=True, sort=False).agg(
+        total_passengers=('total_count', 'sum'),
+        avg_passengers=('total_count', 'mean'), # Average passengers per recorded trip on this route
+        avg_epkm=('Epkm', 'mean'),
+        total_epkm=('Epkm', 'sum'), # Sum of EPKM over all trips on the route
+        total_trips=('trip_number', 'count'), # Total number of records/trips for the route
+        total_distance=('travel_distance', 'sum')
+    )
+    route_passengers = route_stats['total_passengers'].nlargest(10).rename('total_count').reset_index()
+    route_epkm = route_stats['avg_epkm'].nlargest(10).rename('Epkm').reset_index()
+
+    return (monthly_agg, daily_pattern_agg, daily_revenue_by_month, schedule_stats,
+            route_passengers, route_epkm, route_stats.reset_index())
+
+filter_key = tuple(tuple(sorted(selected)) for selected in
+                   (month_filter, week_filter or [], day_filter, service_filter, route_filter))
+(monthly_agg, daily_pattern_agg, daily_revenue_by_month, schedule_stats_all,
+ route_passengers, route_epkm, route_stats_all) = tab_aggregates(filtered_df, filter_key)
+
 
 # Metrics Section
 st.markdown("### Key Performance Indicators (KPIs)")
@@ -422,11 +512,6 @@ with st.container():
         st.markdown("Analyze how revenue and passenger counts change over months.")
         # Ensure data exists before plotting
         if not filtered_df.empty:
-            monthly_agg = filtered_df.groupby('month').agg(
-                total_amount=('total_amount', 'sum'),
-                total_count=('total_count', 'sum')
-            ).reindex(available_months).reset_index()
-
             # Create a combined chart with two y-axes
             fig = go.Figure()
 
@@ -499,7 +584,7 @@ with st.container():
 
             if selected_month_drilldown != 'Select a Month':
                 # Filter data for the selected month
-                daily_data_for_month = filtered_df[filtered_df['month'] == selected_month_drilldown].copy() # Use .copy()
+                daily_data_for_month = filtered_df[filtered_df['month'] == selected_month_drilldown]
 
                 if not daily_data_for_month.empty:
                     # Group by date and sum revenue for the selected month
@@ -531,11 +616,6 @@ with st.container():
         st.markdown("Understand the typical performance pattern across different days of the week.")
         # Ensure data exists before plotting
         if not filtered_df.empty:
-            daily_pattern_agg = filtered_df.groupby('day_of_week', observed=True).agg(
-                avg_revenue=('total_amount', 'mean'),
-                avg_passengers=('total_count', 'mean')
-            ).reindex(day_options).fillna(0).reset_index() # Reindex to ensure all days are present and ordered
-
             # Create a combined bar chart
             fig = go.Figure(data=[
                 go.Bar(name='Average Revenue', x=daily_pattern_agg['day_of_week'], y=daily_pattern_agg['avg_revenue'], marker_color='#3498db'),
@@ -567,10 +647,6 @@ with st.container():
             )
 
             if not filtered_df.empty:
-                daily_revenue_by_month = filtered_df.groupby(['month', 'day_of_week'], observed=True).agg({
-                    'total_amount': 'mean'
-                }).reset_index()
-
                 # Apply drilldown filter if selected
                 if selected_days_drilldown_tab2:
                     daily_revenue_by_month = daily_revenue_by_month[
@@ -634,16 +710,8 @@ with st.container():
                 )
 
             with col2:
-                # Calculate schedule statistics
-                schedule_stats = filtered_df.groupby('schedule_number').agg(
-                    avg_epkm=('Epkm', 'mean'),
-                    total_trips=('trip_number', 'count'), # Count of records for the schedule
-                    total_revenue=('total_amount', 'sum'),
-                    total_distance=('travel_distance', 'sum')
-                ).reset_index()
-
-                # Apply minimum trips filter
-                schedule_stats = schedule_stats[schedule_stats['total_trips'] >= min_trips].copy() # Use .copy()
+                # Apply minimum trips filter to the cached schedule statistics
+                schedule_stats = schedule_stats_all[schedule_stats_all['total_trips'] >= min_trips].copy() # Use .copy()
 
                 if not schedule_stats.empty:
                     # Create visualization
@@ -750,9 +818,9 @@ with st.container():
 
                     if selected_schedules_trend:
                         # Filter data for selected schedules and group by date
-                        trend_data = filtered_df[filtered_df['schedule_number'].isin(selected_schedules_trend)].copy() # Use .copy()
+                        trend_data = filtered_df[filtered_df['schedule_number'].isin(selected_schedules_trend)]
                         if not trend_data.empty:
-                            trend_data_grouped = trend_data.groupby(['running_date', 'schedule_number'])['Epkm'].mean().reset_index()
+                            trend_data_grouped = trend_data.groupby(['running_date', 'schedule_number'], observed=True)['Epkm'].mean().reset_index()
 
                             fig = px.line(
                                 trend_data_grouped,
@@ -810,9 +878,10 @@ with st.container():
         )
 
         # Apply the route filter for this tab
-        tab4_filtered_df = filtered_df.copy() # Start with the main filtered data
+        # Read-only slices of the main filtered data; nothing here writes to them
+        tab4_filtered_df = filtered_df # Start with the main filtered data
         if route_filter_tab4:
-             tab4_filtered_df = tab4_filtered_df[tab4_filtered_df['route_no'].isin(route_filter_tab4)].copy() # Use .copy()
+             tab4_filtered_df = tab4_filtered_df[tab4_filtered_df['route_no'].isin(route_filter_tab4)]
         else:
              st.info("Please select at least one route to view trips per schedule.")
              # Display empty state if no routes are selected
@@ -832,7 +901,7 @@ with st.container():
 
             # Apply the schedule filter for this tab
             if schedule_filter_tab4:
-                tab4_filtered_df = tab4_filtered_df[tab4_filtered_df['schedule_number'].isin(schedule_filter_tab4)].copy() # Use .copy()
+                tab4_filtered_df = tab4_filtered_df[tab4_filtered_df['schedule_number'].isin(schedule_filter_tab4)]
             else:
                  st.info("Please select at least one schedule to view trips.")
                  tab4_filtered_df = pd.DataFrame() # Empty DataFrame
@@ -840,33 +909,56 @@ with st.container():
         # Ensure data exists after applying tab-specific filter before plotting
         if not tab4_filtered_df.empty:
             # Group by date and schedule, find the max trip number for each group
-            trips_per_schedule_day_bar = tab4_filtered_df.groupby(['running_date', 'schedule_number'])['trip_number'].max().reset_index()
-
-            # Create a bar chart showing max trip number over time for each schedule
-            fig = px.bar(
-                trips_per_schedule_day_bar,
-                x='running_date',
-                y='trip_number',
-                color='schedule_number', # Use schedule_number for different bars/colors
-                title="Total Trips per Schedule by Date",
-                labels={'running_date': 'Date', 'trip_number': 'Total Trips', 'schedule_number': 'Schedule Number'},
-                hover_name='schedule_number', # Add hover name
-                hover_data={'running_date': True, 'trip_number': True, 'schedule_number': False}, # Add hover data
-                barmode='stack' # Stack bars if multiple schedules are selected for a day
-            )
+            trips_per_schedule_day_bar = tab4_filtered_df.groupby(['running_date', 'schedule_number'], observed=True)['trip_number'].max().reset_index()
+
+            # Create a bar chart showing max trip number over time for each schedule.
+            # One trace coloured by schedule code rather than one trace per schedule, so the
+            # figure stays a single draw however many schedules are selected.
+            # Codes are taken over the plotted schedules only, so the colour bar keys exactly those
+            bar_schedules = trips_per_schedule_day_bar['schedule_number'].cat.remove_unused_categories()
+            schedule_names = [str(schedule) for schedule in bar_schedules.cat.categories]
+            fig = go.Figure(go.Bar(
+                x=trips_per_schedule_day_bar['running_date'],
+                y=trips_per_schedule_day_bar['trip_number'],
+                marker=dict(
+                    color=bar_schedules.cat.codes.to_numpy(),
+                    colorscale='Viridis',
+                    cmin=0,
+                    cmax=max(len(schedule_names) - 1, 1),
+                    colorbar=dict(
+                        title='Schedule Number',
+                        tickvals=list(range(len(schedule_names))),
+                        ticktext=schedule_names
+                    )
+                ),
+                customdata=bar_schedules.astype(str).to_numpy(),
+                hovertemplate="Date: %{x}<br>Schedule %{customdata}: %{y} trips<extra></extra>"
+            ))
 
             fig.update_layout(
+                title="Total Trips per Schedule by Date",
                 xaxis_title="Date",
                 yaxis_title="Total Trips",
+                barmode='stack', # Stack bars if multiple schedules are selected for a day
                 plot_bgcolor='rgba(0,0,0,0)',
-                hovermode='x unified'
+                hovermode='closest', # One trace, so hover each stacked segment on its own
+                uirevision='keep' # Keep zoom and pan when the filters change
             )
 
             st.plotly_chart(fig, use_container_width=True)
 
             # Add table below the chart
             st.markdown("##### Data Table for Trips per Schedule")
-            st.dataframe(trips_per_schedule_day_bar)
+            # Preview at most MAX_PREVIEW_ROWS rows; the full table is offered as a download
+            st.dataframe(trips_per_schedule_day_bar.head(MAX_PREVIEW_ROWS))
+            if len(trips_per_schedule_day_bar) > MAX_PREVIEW_ROWS:
+                st.caption(f"Showing the first {MAX_PREVIEW_ROWS:,} of {len(trips_per_schedule_day_bar):,} rows.")
+                st.download_button(
+                    label="⬇️ Download full table",
+                    data=trips_per_schedule_day_bar.to_csv(index=False).encode('utf-8'),
+                    file_name="trips_per_schedule.csv",
+                    mime='text/csv'
+                )
 
         elif route_filter_tab4 and schedule_filter_tab4:
              st.info("No data available for the selected routes and schedules with current main filters.")
@@ -883,8 +975,6 @@ with st.container():
             st.markdown("##### Top Routes by Passenger Count")
             # Ensure data exists before plotting
             if not filtered_df.empty:
-                # Group by route and sum passengers, get top 10
-                route_passengers = filtered_df.groupby('route_no')['total_count'].sum().nlargest(10).reset_index()
                 if not route_passengers.empty:
                     fig = px.bar(
                         route_passengers,
@@ -906,8 +996,6 @@ with st.container():
             st.markdown("##### Top Routes by Revenue Efficiency (EPKM)")
             # Ensure data exists before plotting
             if not filtered_df.empty:
-                # Group by route and calculate mean EPKM, get top 10
-                route_epkm = filtered_df.groupby('route_no')['Epkm'].mean().nlargest(10).reset_index()
                 if not route_epkm.empty:
                     fig = px.bar(
                         route_epkm,
@@ -938,11 +1026,11 @@ with st.container():
         if selected_route_drilldown != 'Select a Route':
             st.markdown(f"###### Performance Metrics by Day of Week for Route {selected_route_drilldown}")
             # Filter data for the selected route
-            route_data_drilldown = filtered_df[filtered_df['route_no'] == selected_route_drilldown].copy() # Use .copy()
+            route_data_drilldown = filtered_df[filtered_df['route_no'] == selected_route_drilldown]
 
             if not route_data_drilldown.empty:
                 # Group by day of week and calculate metrics
-                route_grouped_df = route_data_drilldown.groupby('day_of_week', observed=True).agg(
+                route_grouped_df = route_data_drilldown.groupby('day_of_week', observed=True, sort=False).agg(
                     Total_Revenue=('total_amount', 'sum'),
                     Total_Passengers=('total_count', 'sum'),
                     Average_EPKM=('Epkm', 'mean')
@@ -1015,7 +1103,7 @@ with st.container():
                 st.markdown("View the typical passenger volume on each day.")
 
                 # Calculate average passengers by day of week
-                daily_pattern = filtered_df.groupby('day_of_week', observed=True).agg(
+                daily_pattern = filtered_df.groupby('day_of_week', observed=True, sort=False).agg(
                     avg_passengers=('total_count', 'mean'),
                     total_passengers=('total_count', 'sum') # Include total for comparison
                 ).reindex(day_options).reset_index()
@@ -1169,7 +1257,8 @@ with st.container():
                     st.markdown("---")
                     st.markdown("###### Year-over-Year Monthly Comparison")
                     if st.checkbox("Show Year-over-Year Monthly Passenger Comparison"):
-                        yoy_data = filtered_df.copy()
+                        # Copy only the columns this comparison reads before adding the year/month keys
+                        yoy_data = filtered_df[['running_date', 'total_count']].copy()
                         yoy_data['year'] = yoy_data['running_date'].dt.year
                         yoy_data['month_name'] = yoy_data['running_date'].dt.month_name() # Use a different column name
 
@@ -1198,12 +1287,9 @@ with st.container():
                 st.markdown("Compare routes based on average passengers per trip and revenue efficiency.")
 
                 # Calculate route statistics
-                route_stats = filtered_df.groupby('route_no').agg(
-                    total_passengers=('total_count', 'sum'),
-                    avg_passengers=('total_count', 'mean'), # Average passengers per recorded trip on this route
-                    epkm=('Epkm', 'mean'),
-                    total_trips=('trip_number', 'count') # Total number of records/trips for the route
-                ).reset_index()
+                route_stats = route_stats_all[
+                    ['route_no', 'total_passengers', 'avg_passengers', 'avg_epkm', 'total_trips']
+                ].rename(columns={'avg_epkm': 'epkm'})
 
                 if not route_stats.empty:
                     # Create scatter plot
@@ -1263,15 +1349,15 @@ with st.container():
                     with col1:
                         st.markdown("###### Top 5 Routes by Total Passengers")
                         st.dataframe(
-                            route_stats.nlargest(5, 'total_passengers')[['route_no', 'total_passengers']]
-                            .style.format({'total_passengers': '{:,.0f}'})
+                            route_stats.nlargest(5, 'total_passengers')[['route_no', 'total_passengers']],
+                            column_config={'total_passengers': st.column_config.NumberColumn(format='%,.0f')}
                         )
 
                     with col2:
                         st.markdown("###### Top 5 Routes by Average EPKM")
                         st.dataframe(
-                            route_stats.nlargest(5, 'epkm')[['route_no', 'epkm']]
-                            .style.format({'epkm': '₹{:.2f}'})
+                            route_stats.nlargest(5, 'epkm')[['route_no', 'epkm']],
+                            column_config={'epkm': st.column_config.NumberColumn(format='₹%.2f')}
                         )
                 else:
                     st.info("No route data available for comparison with current filters.")
@@ -1326,7 +1412,7 @@ with st.container():
                     st.markdown("###### Passenger-Revenue Correlation by Service Type")
                     if st.checkbox("Show Correlation Breakdown by Service Type"):
                         # Calculate correlation for each service type
-                        service_correlations = filtered_df.groupby('service_type').apply(
+                        service_correlations = filtered_df.groupby('service_type', observed=True).apply(
                             lambda x: x['total_count'].corr(x['total_amount'])
                         ).reset_index(name='correlation')
 
@@ -1467,7 +1553,7 @@ with st.container():
                     }[metric_type]
 
                     # Calculate EPKM metric for each service type
-                    service_epkm = filtered_df.groupby('service_type')['Epkm'].agg(agg_func).reset_index()
+                    service_epkm = filtered_df.groupby('service_type', observed=True)['Epkm'].agg(agg_func).reset_index()
 
                     if not service_epkm.empty:
                         if show_distribution:
@@ -1526,12 +1612,9 @@ with st.container():
 
                 with col2:
                     # Calculate route statistics
-                    route_stats = filtered_df.groupby('route_no').agg(
-                        avg_epkm=('Epkm', 'mean'),
-                        total_epkm=('Epkm', 'sum'), # Calculate total EPKM (sum of EPKM for all trips on route)
-                        total_passengers=('total_count', 'sum'),
-                        total_distance=('travel_distance', 'sum')
-                    ).reset_index()
+                    route_stats = route_stats_all[
+                        ['route_no', 'avg_epkm', 'total_epkm', 'total_passengers', 'total_distance']
+                    ]
 
                     if not route_stats.empty:
                         if efficiency_metric == "Average EPKM":
@@ -1608,7 +1691,7 @@ with st.container():
                         )
 
                         # Identify outliers based on threshold
-                        outliers = df_for_outliers[df_for_outliers['epkm_zscore'] > outlier_threshold].copy() # Use .copy()
+                        outliers = df_for_outliers[df_for_outliers['epkm_zscore'] > outlier_threshold]
 
                         # Determine which data to plot
                         data_to_plot = df_for_outliers if show_context else outliers
@@ -475,33 +475,20 @@ if not filtered_df.empty:
         comparison_df["Distance_MoM"] = comparison_df["Distance"].pct_change() * 100
         comparison_df["EPKM_MoM"] = comparison_df["EPKM"].pct_change() * 100
 
-        # Create a styled DataFrame
-        styled_df = comparison_df.style.format({
-            "Passengers": "{:,.0f}",
-            "Revenue": "₹{:,.2f}",
-            "Distance": "{:,.2f} KM",
-            "EPKM": "₹{:,.2f}",
-            "Passenger_MoM": "{:+.1f}%",
-            "Revenue_MoM": "{:+.1f}%",
-            "Distance_MoM": "{:+.1f}%",
-            "EPKM_MoM": "{:+.1f}%"
-        }).map(lambda x: "color: green" if isinstance(x, str) and x.startswith('+') and float(x.strip('+%')) >= 0 
-                        else "color: red" if isinstance(x, str) and (x.startswith('-') or (x.startswith('+') and float(x.strip('+%')) < 0))
-                        else "", subset=["Passenger_MoM", "Revenue_MoM", "Distance_MoM", "EPKM_MoM"])
-
-        # Display the styled DataFrame
+        # Display the comparison; number formats are applied by the frontend through
+        # column_config rather than a Styler that renders every cell on each rerun
         st.dataframe(
-            styled_df,
+            comparison_df,
             column_config={
                 "Month": "Month",
-                "Passengers": "Passengers",
-                "Revenue": "Revenue (₹)",
-                "Distance": "Distance (KM)",
-                "EPKM": "EPKM (₹/KM)",
-                "Passenger_MoM": "Passenger MoM %",
-                "Revenue_MoM": "Revenue MoM %",
-                "Distance_MoM": "Distance MoM %",
-                "EPKM_MoM": "EPKM MoM %"
+                "Passengers": st.column_config.NumberColumn("Passengers", format="%,.0f"),
+                "Revenue": st.column_config.NumberColumn("Revenue (₹)", format="₹%,.2f"),
+                "Distance": st.column_config.NumberColumn("Distance (KM)", format="%,.2f KM"),
+                "EPKM": st.column_config.NumberColumn("EPKM (₹/KM)", format="₹%,.2f"),
+                "Passenger_MoM": st.column_config.NumberColumn("Passenger MoM %", format="%+.1f%%"),
+                "Revenue_MoM": st.column_config.NumberColumn("Revenue MoM %", format="%+.1f%%"),
+                "Distance_MoM": st.column_config.NumberColumn("Distance MoM %", format="%+.1f%%"),
+                "EPKM_MoM": st.column_config.NumberColumn("EPKM MoM %", format="%+.1f%%"),
             },
             use_container_width=True,
             height=(len(comparison_df) + 1) * 35 + 3